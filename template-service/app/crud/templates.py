@@ -1,17 +1,61 @@
 # app/crud.py
-from ..database import redis_client
-from ..models.templates import Template, TemplateVersion
-from sqlmodel import select, and_, update
-from ..utils.templates import render_template_string
+from ..database import redis_backend, guarded_db_call
+from ..models.templates import Template, TemplateVersion, TemplateContent, TemplateEvent
+from sqlmodel import select, and_, or_, update, delete, func
+from ..utils.templates import render_compiled_template
+from ..utils.cache import CompiledTemplateCache
+from ..utils.metrics import RenderCounters
+from ..utils.routing import RoutingTable
+from ..utils.tenants import DEFAULT_TENANT, TenantRateLimiter
+from ..utils.compression import content_hash, compress_content, decompress_content, decompression_timings
+from ..utils.breaker import BackendUnavailableError
+from ..sec import settings
+from sqlalchemy import text
+from sqlalchemy.orm import selectinload
+from sqlalchemy.exc import IntegrityError
 from fastapi import HTTPException, status
+from datetime import datetime, timezone
+import asyncio
+import json
 
+# Per-worker cache of compiled templates, keyed by content hash with a byte quota per tenant
+compiled_templates = CompiledTemplateCache(
+    default_quota=settings.TENANT_CACHE_QUOTA_BYTES,
+    quotas=settings.TENANT_CACHE_QUOTAS
+)
+# Per-worker parsed routing tables, keyed by (tenant_id, template_key, language)
+_routing_tables = {}
+# Per-worker render counts by (tenant_id, template_key, language, version_id), flushed to Redis periodically
+variant_render_counts = RenderCounters()
+# Per-worker tenant usage counts by (tenant_id, metric), flushed with the variant counts
+tenant_usage_counts = RenderCounters()
+# Returned by redis_backend.call() to tell an unavailable Redis from a cache miss
+_REDIS_UNAVAILABLE = object()
+# Per-worker last routing table that rendered successfully, by (tenant_id, template_key, language),
+# served while Postgres is unavailable. Compiled templates stay in compiled_templates, under the tenant's quota.
+_last_known_good = {}
+# Postgres advisory lock class that serializes a tenant's change feed writers until commit
+CHANGE_FEED_LOCK_ID = 4131
+# Per-worker render rate limits
+render_rate_limiter = TenantRateLimiter(
+    default_rate=settings.TENANT_RENDER_RATE_LIMIT,
+    rates=settings.TENANT_RENDER_RATE_LIMITS
+)
 
-def get_template_by_key(db, template_key):
+
+def get_template_by_key(db, template_key, tenant_id=DEFAULT_TENANT, with_content=False):
     """
-    Fetches a single template by its unique template_key.
+    Fetches a single template by its template_key, unique within the tenant.
+    With with_content its versions and their (compressed) contents are loaded
+    up front, for responses that include every version's content.
     """
     try:
-        statement  = select(Template).where(Template.template_key == template_key)
+        statement  = select(Template).where(
+            Template.tenant_id == tenant_id,
+            Template.template_key == template_key
+        )
+        if with_content:
+            statement = statement.options(selectinload(Template.versions).selectinload(TemplateVersion.blob))
         result = db.execute(statement)
         single_template = result.scalars().first()
         if not single_template:
@@ -27,10 +71,13 @@ def get_template_by_key(db, template_key):
             detail=f"Error fetching template: {e}")
 
 
-def create_template(db, template):
-    """ Creates a new template entry in the database."""
+def create_template(db, template, tenant_id=DEFAULT_TENANT):
+    """ Creates a new template entry for the tenant in the database."""
     try:
-        statement  = select(Template).where(Template.template_key == template.template_key)
+        statement  = select(Template).where(
+            Template.tenant_id == tenant_id,
+            Template.template_key == template.template_key
+        )
         result = db.execute(statement)
         existing_template = result.scalars().first()
         if existing_template:
@@ -38,12 +85,16 @@ def create_template(db, template):
                 status_code=status.HTTP_409_CONFLICT,
                 detail=f"Template with key '{template.template_key}' already exists")
         new_template = Template(
+            tenant_id=tenant_id,
             template_key=template.template_key,
             description=template.description
         )
         db.add(new_template)
+        event = record_event(db, tenant_id, "template.created", new_template.template_key,
+            payload={"description": new_template.description})
         db.commit()
         db.refresh(new_template)
+        publish_events([event])
         return new_template
     except HTTPException as http_exc:
         raise http_exc
@@ -53,26 +104,58 @@ def create_template(db, template):
             detail=f"Error creating template: {e}")
 
 
-def create_template_version(db, template_key, version):
+def store_content(db, content: str) -> str:
+    """
+    Stores this content compressed if it is new and returns its hash.
+    Identical content is stored once no matter how many versions use it.
+    A reused row stays locked until commit, so a concurrent orphan cleanup
+    (_delete_orphaned_contents) skips it instead of deleting it under the new version.
+    """
+    digest = content_hash(content)
+    if _lock_content(db, digest):
+        return digest
+    data = compress_content(content)
+    try:
+        with db.begin_nested():
+            db.add(TemplateContent(hash=digest, data=data, size=len(content.encode()), compressed_size=len(data)))
+    except IntegrityError:
+        # A concurrent request inserted the same content first
+        if _lock_content(db, digest):
+            return digest
+        raise
+    return digest
+
+
+def _lock_content(db, digest) -> bool:
+    """Takes a key-share lock on a stored content, reading only its hash; returns whether it exists."""
+    statement = select(TemplateContent.hash).where(TemplateContent.hash == digest).with_for_update(read=True, key_share=True)
+    return db.execute(statement).scalar() is not None
+
+
+def create_template_version(db, template_key, version, tenant_id=DEFAULT_TENANT):
     try:
-        db_template = get_template_by_key(db, template_key)
+        db_template = get_template_by_key(db, template_key, tenant_id)
         # Find current max version and increment
-        statement_version = select(TemplateVersion).where(TemplateVersion.template_id == db_template.id).order_by(TemplateVersion.version.desc())
+        statement_version = select(TemplateVersion.version).where(TemplateVersion.template_id == db_template.id).order_by(TemplateVersion.version.desc())
         result_version = db.execute(statement_version)
         current_max_version = result_version.scalars().first()
         
-        next_version = (current_max_version.version + 1) if current_max_version else 1
+        next_version = (current_max_version + 1) if current_max_version else 1
         
+        stored_hash = store_content(db, version.content)
         db_version = TemplateVersion(
-            content=version.content,
+            content_hash=stored_hash,
             language=version.language,
             version=next_version,
             is_active=False, # New versions are not active by default
             template_id=db_template.id
         )
         db.add(db_version)
+        event = record_event(db, tenant_id, "version.created", template_key, db_version.language, db_version.id,
+            {"version": next_version, "content_hash": stored_hash})
         db.commit()
         db.refresh(db_version)
+        publish_events([event])
         return db_version
     except HTTPException as http_exc:
         raise http_exc
@@ -81,20 +164,83 @@ def create_template_version(db, template_key, version):
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error creating template version: {e}")
     
-def activate_single_template_version(template_key, version, db):
+def swap_active_version(db, template_key, template_id, language, variant, scheduled_at=None, tenant_id=DEFAULT_TENANT) -> bool:
+    """
+    Makes a version the only active version for its template/language in one transaction,
+    together with its version.activated change event.
+    - variant: dict with the version's id, version and content_hash; the event is built
+      from it, so the swap is two UPDATEs and the event INSERT with no reads.
+    With scheduled_at the swap only happens while the version is still scheduled for
+    exactly that time, so the schedulers running in every worker flip it exactly once
+    and a cancelled or rescheduled activation is never applied.
+    Returns False (and rolls back) if there was nothing to swap.
+    """
+    version_id = variant["id"]
+    claim = update(TemplateVersion).where(TemplateVersion.id == version_id)
+    if scheduled_at is not None:
+        claim = claim.where(TemplateVersion.activate_at == scheduled_at)
+    result = db.execute(claim.values(is_active=True, weight=100, activate_at=None))
+    if result.rowcount == 0:
+        db.rollback()
+        return False
+
+    # Deactivate every other active version for the same language
+    statement = update(TemplateVersion).where(and_(TemplateVersion.template_id == template_id,
+        TemplateVersion.language == language,
+        TemplateVersion.id != version_id,
+        TemplateVersion.is_active == True)).values(is_active = False)
+    db.execute(statement)
+    event = record_event(db, tenant_id, "version.activated", template_key, language, version_id, {"variants": [
+        {"id": version_id, "version": variant["version"], "weight": 100, "content_hash": variant["content_hash"]}
+    ]})
+    db.commit()
+    publish_events([event])
+    return True
+
+
+def publish_routing_table(template_key, language, variants, tenant_id=DEFAULT_TENANT) -> RoutingTable:
+    """
+    Points the Redis cache at the newly active version(s) of a template/language.
+    - variants: list of dicts with id, version, weight, content_hash and the compressed
+      content data, ordered by version.
+    The contents are written before the routing table so a reader following the
+    table never cold-misses, and the table is overwritten rather than deleted.
+    If Redis is unavailable, the cached table is dropped once it is back so
+    readers never follow a stale one.
+    """
+    table = RoutingTable([
+        {"id": v["id"], "version": v["version"], "weight": v["weight"], "content_hash": v["content_hash"]}
+        for v in variants
+    ])
+    variants_key = _variants_cache_key(tenant_id, template_key, language)
+
+    def write(client):
+        pipe = client.pipeline()
+        for v in variants:
+            pipe.set(_content_cache_key(tenant_id, v["content_hash"]), v["data"], ex=3600) # Cache for 1 hour
+        pipe.set(variants_key, table.raw, ex=3600)
+        pipe.execute()
+        return True
+
+    if not redis_backend.call(write, default=False):
+        redis_backend.defer(variants_key, lambda client: client.delete(variants_key))
+    _routing_tables[(tenant_id, template_key, language)] = table
+    return table
+
+
+def warm_content_cache(content_hash, data, tenant_id=DEFAULT_TENANT) -> None:
+    """Pre-loads a content's compiled form and its (compressed) Redis entry."""
+    compiled_templates.put(tenant_id, content_hash, decompress_content(data))
+    redis_backend.call(lambda client: client.set(_content_cache_key(tenant_id, content_hash), data, ex=3600))
+
+
+def activate_single_template_version(template_key, version, db, tenant_id=DEFAULT_TENANT):
     """
     Activates a specific version of a template.
     Deactivates any other active versions for that template.
     """
     try:
-        
-        
-        # Deactivate other versions
-        # for v in db_template.versions:
-        #     v.is_active = (v.version == version)
-        
-        # db.commit()
-        db_template = get_template_by_key(db, template_key)
+        db_template = get_template_by_key(db, template_key, tenant_id)
         #find the version to activate
         statement = select(TemplateVersion).where(
             TemplateVersion.template_id == db_template.id,
@@ -107,34 +253,31 @@ def activate_single_template_version(template_key, version, db):
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Version '{version}' for template '{template_key}' not found")
-        # 2. Get its language and template_id for the "smart" update
-        lang_to_update = db_version.language
-        #template_id_to_update = db_version.id
-
-        # Deactivate all versions
-        statement = update(TemplateVersion).where(and_(TemplateVersion.template_id == db_template.id,
-            TemplateVersion.language == lang_to_update,
-            TemplateVersion.is_active == True)).values(is_active = False)   
-        deactivate_all_versions = db.execute(statement)
-
-        # 4. Activate the target version
-        db_version.is_active = True
-        db.add(db_version)
 
-        # 5. Commit both changes
+        # Activate the target version and deactivate the others in one commit.
+        # A manual activation also clears any pending schedule for this version.
         try:
-            db.commit()
-            db.refresh(db_version)
+            swapped = swap_active_version(db, template_key, db_template.id, db_version.language, {
+                "id": db_version.id, "version": db_version.version, "content_hash": db_version.content_hash
+            }, tenant_id=tenant_id)
         except Exception as e:
+            db.rollback()
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"Database error: {e}"
             )
+        # The version was deleted between the lookup and the swap.
+        if not swapped:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Version '{version}' for template '{template_key}' not found")
 
-        # 6. IMPORTANT: Clear the cache for this specific template/language
-        if redis_client:
-            cache_key = f"template:{template_key}:{lang_to_update}:active"
-            redis_client.delete(cache_key)
+        # IMPORTANT: Repoint the cache for this specific template/language
+        publish_routing_table(template_key, db_version.language, [
+            {"id": db_version.id, "version": db_version.version, "weight": 100,
+             "content_hash": db_version.content_hash, "data": db_version.blob.data}
+        ], tenant_id)
+        compiled_templates.put(tenant_id, db_version.content_hash, db_version.content)
 
         return {"message": f"Template '{template_key}' version '{version}' activated successfully."}
     
@@ -144,81 +287,426 @@ def activate_single_template_version(template_key, version, db):
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error activating template version: {e}")
-    
 
 
-def _query_active_template_from_db(db, template_key, language) -> str | None:
-    """Helper function to query the database for the active template."""
+def set_template_variants(template_key, variants, db, tenant_id=DEFAULT_TENANT):
+    """
+    Activates several versions of a template/language with traffic weights (A/B testing).
+    Any other active version for that language is deactivated.
+    """
+    try:
+        db_template = get_template_by_key(db, template_key, tenant_id)
+        statement = select(TemplateVersion).where(
+            TemplateVersion.template_id == db_template.id,
+            TemplateVersion.id.in_(list(variants.weights))
+        ).order_by(TemplateVersion.version).options(selectinload(TemplateVersion.blob))
+        result = db.execute(statement)
+        db_versions = result.scalars().all()
+
+        missing = set(variants.weights) - {v.id for v in db_versions}
+        if missing:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Versions {sorted(missing)} for template '{template_key}' not found")
+        wrong_language = [v.id for v in db_versions if v.language != variants.language]
+        if wrong_language:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Versions {wrong_language} are not '{variants.language}' versions")
+
+        try:
+            statement = update(TemplateVersion).where(and_(TemplateVersion.template_id == db_template.id,
+                TemplateVersion.language == variants.language,
+                TemplateVersion.id.not_in(list(variants.weights)),
+                TemplateVersion.is_active == True)).values(is_active = False)
+            db.execute(statement)
+            for db_version in db_versions:
+                db_version.is_active = True
+                db_version.weight = variants.weights[db_version.id]
+                db_version.activate_at = None
+                db.add(db_version)
+            event = _record_activation_event(db, tenant_id, template_key, db_template.id, variants.language)
+            db.commit()
+            publish_events([event])
+        except Exception as e:
+            db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Database error: {e}"
+            )
+
+        publish_routing_table(template_key, variants.language, [
+            {"id": v.id, "version": v.version, "weight": v.weight, "content_hash": v.content_hash, "data": v.blob.data}
+            for v in db_versions
+        ], tenant_id)
+        return {"message": f"Template '{template_key}' now splits '{variants.language}' traffic across {len(db_versions)} version(s)."}
+    except HTTPException as http_exc:
+        raise http_exc
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error setting template variants: {e}")
+
+
+def get_template_variants(template_key, language, db, tenant_id=DEFAULT_TENANT):
+    """
+    Returns the active versions of a template/language with their weights and
+    render counts flushed so far by all workers.
+    """
+    try:
+        db_template = get_template_by_key(db, template_key, tenant_id)
+        statement = select(TemplateVersion).where(
+            TemplateVersion.template_id == db_template.id,
+            TemplateVersion.language == language,
+            TemplateVersion.is_active == True
+        ).order_by(TemplateVersion.version)
+        db_versions = db.execute(statement).scalars().all()
+        renders = _decode_hash(redis_backend.call(
+            lambda client: client.hgetall(_variant_renders_cache_key(tenant_id, template_key, language)), default={}))
+        return {
+            "template_key": template_key,
+            "language": language,
+            "variants": [
+                {"id": v.id, "version": v.version, "weight": v.weight, "renders": int(renders.get(v.id, 0))}
+                for v in db_versions
+            ]
+        }
+    except HTTPException as http_exc:
+        raise http_exc
+
+
+def _flush_counts(counters, key_and_field) -> None:
+    counts = counters.drain()
+    if not counts:
+        return
+
+    def write(client):
+        pipe = client.pipeline()
+        for label, count in counts.items():
+            pipe.hincrby(*key_and_field(label), count)
+        pipe.execute()
+        return True
+
+    # Keep the deltas for the next flush while Redis is unavailable
+    if not redis_backend.call(write, default=False):
+        counters.restore(counts)
+
+
+def flush_render_counts() -> None:
+    """Adds this worker's variant render counts and tenant usage counts to the shared Redis hashes."""
+    _flush_counts(variant_render_counts, lambda label: (
+        _variant_renders_cache_key(label[0], label[1], label[2]), label[3]))
+    _flush_counts(tenant_usage_counts, lambda label: (
+        _tenant_usage_cache_key(label[0]), label[1]))
+
+
+def get_tenant_usage(db, tenant_id=DEFAULT_TENANT):
+    """
+    Returns a tenant's usage for capacity planning:
+    - stored templates, versions and content bytes (DB)
+    - render counts flushed so far by all workers (Redis)
+    - this worker's in-process cache usage
+    """
+    statement = select(
+        func.count(func.distinct(Template.id)),
+        func.count(TemplateVersion.id),
+        func.coalesce(func.sum(TemplateContent.size), 0)
+    ).select_from(Template).outerjoin(TemplateVersion).outerjoin(TemplateContent).where(Template.tenant_id == tenant_id)
+    templates, versions, content_bytes = db.execute(statement).one()
+    usage = _decode_hash(redis_backend.call(
+        lambda client: client.hgetall(_tenant_usage_cache_key(tenant_id)), default={}))
+    return {
+        "tenant_id": tenant_id,
+        "templates": templates,
+        "versions": versions,
+        "content_bytes": content_bytes,
+        "renders": int(usage.get("renders", 0)),
+        "rendered_bytes": int(usage.get("rendered_bytes", 0)),
+        "rate_limited": int(usage.get("rate_limited", 0)),
+        "degraded_renders": int(usage.get("degraded_renders", 0)),
+        "render_rate_limit": render_rate_limiter.rate_for(tenant_id),
+        "worker_cache": compiled_templates.stats(tenant_id)
+    }
+
+
+def get_storage_report(db, tenant_id=DEFAULT_TENANT):
+    """
+    Reports what content-addressed, compressed storage saves for a tenant:
+    - logical_bytes: what storing every version's content in full would take
+    - unique_bytes: after deduplication by content hash
+    - stored_bytes: after compression (also what each content costs in Redis)
+    - decompression: the per-lookup cost measured in this worker
+    """
+    tenant_hashes = select(TemplateVersion.content_hash).join(Template).where(Template.tenant_id == tenant_id)
+    statement = select(
+        func.count(TemplateVersion.id),
+        func.coalesce(func.sum(TemplateContent.size), 0)
+    ).select_from(TemplateVersion).join(Template).join(TemplateContent).where(Template.tenant_id == tenant_id)
+    versions, logical_bytes = db.execute(statement).one()
+    statement = select(
+        func.count(TemplateContent.hash),
+        func.coalesce(func.sum(TemplateContent.size), 0),
+        func.coalesce(func.sum(TemplateContent.compressed_size), 0)
+    ).where(TemplateContent.hash.in_(tenant_hashes))
+    unique_contents, unique_bytes, stored_bytes = db.execute(statement).one()
+    return {
+        "tenant_id": tenant_id,
+        "versions": versions,
+        "unique_contents": unique_contents,
+        "logical_bytes": logical_bytes,
+        "unique_bytes": unique_bytes,
+        "stored_bytes": stored_bytes,
+        "saved_bytes": logical_bytes - stored_bytes,
+        "dedup_ratio": (logical_bytes / unique_bytes) if unique_bytes else 1.0,
+        "compression_ratio": (unique_bytes / stored_bytes) if stored_bytes else 1.0,
+        "decompression": decompression_timings.snapshot()
+    }
+
+
+def schedule_template_version_activation(template_key, schedule, db, tenant_id=DEFAULT_TENANT):
+    """
+    Stores an activation time for a version. The activation scheduler pre-warms
+    the version ahead of time and flips it to active at activate_at.
+    """
     try:
-        statement = select(TemplateVersion.content).join(Template).where(and_(
+        db_template = get_template_by_key(db, template_key, tenant_id)
+        statement = select(TemplateVersion).where(
+            TemplateVersion.template_id == db_template.id,
+            TemplateVersion.id == schedule.version
+        )
+        result = db.execute(statement)
+        db_version = result.scalars().first()
+        if not db_version:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Version '{schedule.version}' for template '{template_key}' not found")
+        if schedule.activate_at <= datetime.now(timezone.utc):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="activate_at must be in the future")
+
+        db_version.activate_at = schedule.activate_at
+        db.add(db_version)
+        db.commit()
+        db.refresh(db_version)
+        return {"message": f"Template '{template_key}' version '{schedule.version}' scheduled for activation at {db_version.activate_at.isoformat()}."}
+    except HTTPException as http_exc:
+        raise http_exc
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error scheduling template version: {e}")
+
+
+def cancel_scheduled_activation(template_key, version, db, tenant_id=DEFAULT_TENANT):
+    """Clears a pending activation time for a version."""
+    try:
+        db_template = get_template_by_key(db, template_key, tenant_id)
+        statement = update(TemplateVersion).where(and_(
+            TemplateVersion.template_id == db_template.id,
+            TemplateVersion.id == version,
+            TemplateVersion.activate_at.is_not(None))).values(activate_at=None)
+        result = db.execute(statement)
+        if result.rowcount == 0:
+            db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"No scheduled activation for version '{version}' of template '{template_key}'")
+        db.commit()
+        return
+    except HTTPException as http_exc:
+        raise http_exc
+
+
+def _variants_cache_key(tenant_id, template_key, language) -> str:
+    return f"template:{tenant_id}:{template_key}:{language}:variants"
+
+
+def _variant_renders_cache_key(tenant_id, template_key, language) -> str:
+    return f"template:{tenant_id}:{template_key}:{language}:variant_renders"
+
+
+def _content_cache_key(tenant_id, content_hash) -> str:
+    return f"template:{tenant_id}:content:{content_hash}"
+
+
+def _tenant_usage_cache_key(tenant_id) -> str:
+    return f"template:{tenant_id}:usage"
+
+
+def _decode_hash(values: dict) -> dict:
+    return {key.decode(): value.decode() for key, value in values.items()}
+
+
+def _query_active_variants_from_db(db, template_key, language, tenant_id) -> list[dict]:
+    """Helper function to query the database for the active versions of a template/language."""
+    try:
+        statement = select(
+            TemplateVersion.id,
+            TemplateVersion.version,
+            TemplateVersion.weight,
+            TemplateVersion.content_hash,
+            TemplateContent.data
+        ).join(Template).join(TemplateContent).where(and_(
+            Template.tenant_id == tenant_id,
             Template.template_key == template_key,
             TemplateVersion.language == language,
             TemplateVersion.is_active == True
-        ))
+        )).order_by(TemplateVersion.version)
         result = db.execute(statement)   
-        content = result.scalars().first()
-        if not content:
+        rows = result.all()
+        if not rows:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Active template not found for key '{template_key}' and language '{language}'" )
-        return content
+        return [row._asdict() for row in rows]
     except HTTPException as http_exc:
         raise http_exc
+
+
+def _query_content_from_db(db, content_hash) -> bytes | None:
+    statement = select(TemplateContent.data).where(TemplateContent.hash == content_hash)
+    return db.execute(statement).scalars().first()
+
+
+def _get_cached_routing_table(tenant_id, template_key, language) -> RoutingTable | None:
+    """
+    Reads the routing table from Redis. The parsed table is kept in-process
+    and only rebuilt when the cached JSON changes.
+    While Redis is unavailable the in-process table is used as is, so an
+    outage doesn't move every render onto the DB.
+    """
+    raw = redis_backend.call(
+        lambda client: client.get(_variants_cache_key(tenant_id, template_key, language)), default=_REDIS_UNAVAILABLE)
+    if raw is _REDIS_UNAVAILABLE:
+        return _routing_tables.get((tenant_id, template_key, language))
+    if not raw:
+        return None
+    raw = raw.decode()
+    table = _routing_tables.get((tenant_id, template_key, language))
+    if table is None or table.raw != raw:
+        table = RoutingTable.from_json(raw)
+        _routing_tables[(tenant_id, template_key, language)] = table
+    return table
     
 
-def get_active_template_content(db, template_key, language) -> str | None:
+def get_active_variant(db, template_key, language, recipient_id=None, tenant_id=DEFAULT_TENANT):
     """
-    Fetches the active template content.
-    1. Check Redis Cache
-    2. If miss, query DB and populate cache
+    Picks the active version to render and returns (version_id, compiled template).
+    1. Load the routing table from the cache
+    2. Assign a variant in memory (sticky by recipient_id)
+    3. Serve the compiled template from the in-process cache, else load and decompress its content (Redis, then DB)
+    4. If the table is missing or stale, query DB and repopulate the cache
+       (while Redis is unavailable, only if this worker has no table yet)
+    5. If the DB is unavailable, serve this worker's last-known-good copy
     """
     try:
-        if not redis_client:
-            # Fallback if Redis is down
-            return _query_active_template_from_db(db, template_key, language)
+        table = _get_cached_routing_table(tenant_id, template_key, language)
+        if table is not None:
+            variant = table.assign(template_key, recipient_id)
+            compiled = compiled_templates.get(tenant_id, variant["content_hash"])
+            if compiled is None:
+                data = redis_backend.call(lambda client: client.get(_content_cache_key(tenant_id, variant["content_hash"])))
+                if not data:
+                    try:
+                        data = guarded_db_call(lambda: _query_content_from_db(db, variant["content_hash"]))
+                    except BackendUnavailableError:
+                        return _serve_last_known_good(tenant_id, template_key, language, recipient_id)
+                if data:
+                    compiled = compiled_templates.put(tenant_id, variant["content_hash"], decompress_content(data))
+            if compiled is not None:
+                _last_known_good[(tenant_id, template_key, language)] = table
+                return variant["id"], compiled
 
-        # 1. Check Cache
-        cache_key = f"template:{template_key}:{language}:active"
-        cached_content = redis_client.get(cache_key)
-        
-        if cached_content:
-            return cached_content
-
-        # 2. Cache Miss: Query DB
-        content = _query_active_template_from_db(db, template_key, language)
-        
-        # 3. Populate Cache
-        if content:
-            redis_client.set(cache_key, content, ex=3600) # Cache for 1 hour
-            
-        return content
+        # Cache miss (or Redis down and no table in this worker): query DB
+        try:
+            variants = guarded_db_call(lambda: _query_active_variants_from_db(db, template_key, language, tenant_id))
+        except BackendUnavailableError:
+            return _serve_last_known_good(tenant_id, template_key, language, recipient_id)
+        table = publish_routing_table(template_key, language, variants, tenant_id)
+        variant = table.assign(template_key, recipient_id)
+        compiled = compiled_templates.get(tenant_id, variant["content_hash"])
+        if compiled is None:
+            data = next(v["data"] for v in variants if v["id"] == variant["id"])
+            compiled = compiled_templates.put(tenant_id, variant["content_hash"], decompress_content(data))
+        _last_known_good[(tenant_id, template_key, language)] = table
+        return variant["id"], compiled
     except HTTPException as http_exc:
         raise http_exc
 
 
-def render_template_internal(template_key, request, db):
+def _serve_last_known_good(tenant_id, template_key, language, recipient_id):
+    """
+    Degraded mode: picks a variant from the last routing table this worker served.
+    If the sticky variant is no longer in the compiled cache, another cached variant is used.
+    - Raises: 503 if this worker has never served the template/language or
+      none of its variants is still cached.
+    """
+    table = _last_known_good.get((tenant_id, template_key, language))
+    if table is not None:
+        variant = table.assign(template_key, recipient_id)
+        for candidate in [variant] + [v for v in table.variants if v is not variant]:
+            compiled = compiled_templates.get(tenant_id, candidate["content_hash"])
+            if compiled is not None:
+                tenant_usage_counts.increment((tenant_id, "degraded_renders"))
+                return candidate["id"], compiled
+    raise HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=f"Template store unavailable and no last-known-good copy of '{template_key}' ({language})")
+
+
+def render_template_internal(template_key, request, db, tenant_id=DEFAULT_TENANT):
     """
     Internal function to render a template.
     Used by the API endpoint.
     """
     try:
-        content = get_active_template_content(db, template_key, request.language)
-        if not content:
+        if not render_rate_limiter.allow(tenant_id):
+            tenant_usage_counts.increment((tenant_id, "rate_limited"))
             raise HTTPException(
-                status_code=404, 
-                detail=f"Active template not found for key '{template_key}' and language '{request.language}'"
-            )
-        
-        response = render_template_string(content, request.variables)
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=f"Render rate limit exceeded for tenant '{tenant_id}'")
+        version_id, compiled = get_active_variant(db, template_key, request.language, request.recipient_id, tenant_id)
+        response = render_compiled_template(compiled, request.variables)
+        variant_render_counts.increment((tenant_id, template_key, request.language, version_id))
+        tenant_usage_counts.increment((tenant_id, "renders"))
+        tenant_usage_counts.increment((tenant_id, "rendered_bytes"), len(response))
         return {
-            "rendered_content": response
+            "rendered_content": response,
+            "version_id": version_id
             }
     except HTTPException as http_exc:
         raise http_exc
 
-def delete_template_and_version(template_key: str, version: str, db):
+
+def _delete_orphaned_contents(db, content_hashes) -> None:
+    """
+    Deletes stored contents that no remaining version refers to.
+    Rows locked by a concurrent store_content are about to be reused and are skipped.
+    """
+    still_used = select(TemplateVersion.content_hash).where(TemplateVersion.content_hash.in_(content_hashes))
+    orphans = select(TemplateContent.hash).where(
+        TemplateContent.hash.in_(content_hashes),
+        TemplateContent.hash.not_in(still_used)
+    ).with_for_update(skip_locked=True)
+    db.execute(delete(TemplateContent).where(TemplateContent.hash.in_(orphans)))
+
+
+def _evict_version_cache(tenant_id, template_key, db_version) -> None:
+    """
+    Drops a deleted active version's routing table from Redis and this worker.
+    Cached contents are keyed by hash and may be shared, so they just expire.
+    """
+    if db_version.is_active:
+        variants_key = _variants_cache_key(tenant_id, template_key, db_version.language)
+        if redis_backend.call(lambda client: client.delete(variants_key)) is None:
+            redis_backend.defer(variants_key, lambda client: client.delete(variants_key))
+        _routing_tables.pop((tenant_id, template_key, db_version.language), None)
+        _last_known_good.pop((tenant_id, template_key, db_version.language), None)
+
+def delete_template_and_version(template_key: str, version: str, db, tenant_id=DEFAULT_TENANT):
     try:
-        db_template = get_template_by_key(db, template_key)
+        db_template = get_template_by_key(db, template_key, tenant_id)
         statement = select(TemplateVersion).where(
             TemplateVersion.template_id == db_template.id,
             TemplateVersion.id == version
@@ -231,16 +719,227 @@ def delete_template_and_version(template_key: str, version: str, db):
                 detail=f"Version '{version}' for template '{template_key}' not found"
             )
         db.delete(db_version)
+        db.flush()
+        _delete_orphaned_contents(db, [db_version.content_hash])
+        payload = {"version": db_version.version, "was_active": db_version.is_active}
+        if db_version.is_active:
+            payload["variants"] = _active_variants(db, db_template.id, db_version.language)
+        event = record_event(db, tenant_id, "version.deleted", template_key, db_version.language, db_version.id, payload)
         db.commit()
+        publish_events([event])
+        _evict_version_cache(tenant_id, template_key, db_version)
         return
     except HTTPException as httpexc:
         raise httpexc
     
-def delete_template_and_all_versions(template_key, db):
+def delete_template_and_all_versions(template_key, db, tenant_id=DEFAULT_TENANT):
     try:
-        db_template = get_template_by_key(db, template_key)
+        db_template = get_template_by_key(db, template_key, tenant_id)
+        versions = list(db_template.versions)
         db.delete(db_template)
+        db.flush()
+        _delete_orphaned_contents(db, list({v.content_hash for v in versions}))
+        event = record_event(db, tenant_id, "template.deleted", template_key,
+            payload={"languages": sorted({v.language for v in versions if v.is_active})})
         db.commit()
+        publish_events([event])
+        for db_version in versions:
+            _evict_version_cache(tenant_id, template_key, db_version)
         return
     except HTTPException as httpexc:
-        raise httpexc
\ No newline at end of file
+        raise httpexc
+
+
+# --- Change feed ---
+
+def record_event(db, tenant_id, event_type, template_key, language=None, version_id=None, payload=None) -> TemplateEvent:
+    """
+    Adds a change event to the outbox in the caller's transaction; call it
+    last, right before commit. On Postgres, a tenant's event writers are
+    serialized until commit, so the tenant's revisions become visible in order
+    and a consumer reading past its last revision never skips one that commits
+    late. Waiting for the lock (and the rest of the transaction) is bounded by
+    CHANGE_FEED_LOCK_TIMEOUT_MS instead of the request statement timeout.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text(f"SET LOCAL statement_timeout = {int(settings.CHANGE_FEED_LOCK_TIMEOUT_MS)}"))
+        db.execute(text("SELECT pg_advisory_xact_lock(:lock_id, hashtext(:tenant_id))"),
+            {"lock_id": CHANGE_FEED_LOCK_ID, "tenant_id": tenant_id})
+    event = TemplateEvent(
+        tenant_id=tenant_id,
+        event_type=event_type,
+        template_key=template_key,
+        language=language,
+        version_id=version_id,
+        payload=payload or {}
+    )
+    db.add(event)
+    db.flush()
+    return event
+
+
+def _active_variants(db, template_id, language) -> list[dict]:
+    statement = select(
+        TemplateVersion.id,
+        TemplateVersion.version,
+        TemplateVersion.weight,
+        TemplateVersion.content_hash
+    ).where(
+        TemplateVersion.template_id == template_id,
+        TemplateVersion.language == language,
+        TemplateVersion.is_active == True
+    ).order_by(TemplateVersion.version)
+    return [row._asdict() for row in db.execute(statement).all()]
+
+
+def _record_activation_event(db, tenant_id, template_key, template_id, language, version_id=None) -> TemplateEvent:
+    """Records the active versions (the routing table) of a template/language after an activation."""
+    return record_event(db, tenant_id, "version.activated", template_key, language, version_id,
+        {"variants": _active_variants(db, template_id, language)})
+
+
+def _changes_stream_key(tenant_id) -> str:
+    return f"template:{tenant_id}:changes"
+
+
+# Last outbox revision whose routing tables sync_routing_tables has dropped, per tenant.
+# Revisions only commit in order within a tenant (see record_event), so one global
+# watermark could skip a tenant's revision that commits after another tenant's higher one.
+ROUTING_SYNC_KEY = "template:routing_sync_revisions"
+
+
+def sync_routing_tables(session_factory, client) -> None:
+    """
+    Drops the cached routing table of every template/language the outbox shows
+    changing since the last sync, so the next render rebuilds it from the DB.
+    This covers tables Redis kept through an outage whose invalidation never
+    arrived, including invalidations lost with a worker restarted meanwhile.
+    Registered as a Redis recovery call: runs at startup and after each outage.
+    """
+    synced = {tenant_id: int(revision) for tenant_id, revision in _decode_hash(client.hgetall(ROUTING_SYNC_KEY)).items()}
+    rows = []
+    with session_factory() as db:
+        statement = select(TemplateEvent.tenant_id, func.max(TemplateEvent.revision)).group_by(TemplateEvent.tenant_id)
+        latest = dict(guarded_db_call(lambda: db.execute(statement).all()))
+        # On the first sync (or if Redis lost its data, tables included) start from the current revisions
+        behind = {
+            tenant_id: synced.get(tenant_id, 0) for tenant_id, revision in latest.items()
+            if synced and revision > synced.get(tenant_id, 0)
+        }
+        if behind:
+            statement = select(
+                TemplateEvent.tenant_id,
+                TemplateEvent.template_key,
+                TemplateEvent.language,
+                TemplateEvent.payload
+            ).where(
+                TemplateEvent.event_type.in_(("version.activated", "version.deleted", "template.deleted")),
+                or_(*[
+                    and_(TemplateEvent.tenant_id == tenant_id, TemplateEvent.revision > revision)
+                    for tenant_id, revision in behind.items()
+                ])
+            )
+            rows = guarded_db_call(lambda: db.execute(statement).all())
+    keys = set()
+    for row in rows:
+        for language in ([row.language] if row.language else row.payload.get("languages", [])):
+            keys.add(_variants_cache_key(row.tenant_id, row.template_key, language))
+    pipe = client.pipeline()
+    if keys:
+        pipe.delete(*keys)
+    if latest:
+        pipe.hset(ROUTING_SYNC_KEY, mapping=latest)
+    pipe.execute()
+    if keys:
+        print(f"Dropped {len(keys)} cached routing table(s) changed since the last sync")
+
+
+def publish_events(events) -> None:
+    """
+    Copies committed events to their tenant's Redis Stream, best effort.
+    The stream is only a wake-up hint for waiting consumers: it is written
+    after commit (so entries can be out of revision order) and nothing is
+    relayed if Redis is unavailable. Events are read from the outbox.
+    """
+    def write(client):
+        pipe = client.pipeline()
+        for event in events:
+            pipe.xadd(_changes_stream_key(event.tenant_id), {
+                "revision": event.revision,
+                "event_type": event.event_type,
+                "template_key": event.template_key,
+                "language": event.language or "",
+                "version_id": event.version_id or "",
+                "payload": json.dumps(event.payload)
+            }, maxlen=settings.CHANGE_STREAM_MAXLEN, approximate=True)
+        pipe.execute()
+
+    redis_backend.call(write)
+
+
+def get_template_changes(db, since, limit, include_content=False, tenant_id=DEFAULT_TENANT):
+    """
+    Returns up to limit events after revision since, oldest first.
+    With include_content, the decompressed content of every version the
+    events refer to is included, so a consumer can keep a full replica.
+    """
+    statement = select(TemplateEvent).where(
+        TemplateEvent.tenant_id == tenant_id,
+        TemplateEvent.revision > since
+    ).order_by(TemplateEvent.revision).limit(limit)
+    events = db.execute(statement).scalars().all()
+    contents = {}
+    if include_content:
+        hashes = {e.payload["content_hash"] for e in events if "content_hash" in e.payload}
+        hashes.update(v["content_hash"] for e in events for v in e.payload.get("variants", []))
+        if hashes:
+            statement = select(TemplateContent.hash, TemplateContent.data).where(TemplateContent.hash.in_(hashes))
+            contents = {row.hash: decompress_content(row.data) for row in db.execute(statement).all()}
+    return {
+        "revision": events[-1].revision if events else since,
+        "events": events,
+        "contents": contents
+    }
+
+
+def _read_template_changes(session_factory, since, limit, include_content, tenant_id):
+    # A short-lived session, so a waiting long-poll doesn't hold a pooled connection
+    with session_factory() as db:
+        return guarded_db_call(lambda: get_template_changes(db, since, limit, include_content, tenant_id))
+
+
+def _last_stream_id(tenant_id):
+    """The id of the newest entry in the tenant's change stream, or None if Redis is unavailable."""
+    entries = redis_backend.call(lambda client: client.xrevrange(_changes_stream_key(tenant_id), count=1))
+    if entries is None:
+        return None
+    return entries[0][0] if entries else b"0-0"
+
+
+async def wait_for_template_changes(session_factory, since, limit, timeout, include_content=False, tenant_id=DEFAULT_TENANT):
+    """
+    Long-poll over the change feed: returns as soon as there are events after
+    since, or an empty batch once timeout seconds have passed.
+    While waiting, the outbox is only queried again when the tenant's Redis
+    Stream moves (or on every check while Redis is unavailable).
+    - Raises: 503 if the database is unavailable.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    # Read the stream position first so an event committed during the query still wakes us
+    stream_id = await asyncio.to_thread(_last_stream_id, tenant_id)
+    while True:
+        try:
+            changes = await asyncio.to_thread(_read_template_changes, session_factory, since, limit, include_content, tenant_id)
+        except BackendUnavailableError as e:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=f"Change feed unavailable: {e}")
+        if changes["events"] or loop.time() >= deadline:
+            return changes
+        while loop.time() < deadline:
+            await asyncio.sleep(min(settings.CHANGE_FEED_POLL_INTERVAL, deadline - loop.time()))
+            latest = await asyncio.to_thread(_last_stream_id, tenant_id)
+            if latest is None or latest != stream_id:
+                stream_id = latest
+                break
@@ -1,18 +1,36 @@
 # app/database.py
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from sqlmodel import SQLModel
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from .sec import settings
+from .utils.database import migrate_inline_template_content
+from .utils.breaker import CircuitBreaker, BackendUnavailableError
+from fastapi import HTTPException
+from collections import OrderedDict
+from threading import Lock
 import redis
 
 # 1. PostgreSQL (Sync) Setup
 # We pass the 'sslmode': 'require' in connect_args.
 # This is the correct way for psycopg2 (the sync driver).
+# Timeouts make a stalled Postgres fail fast instead of piling up requests.
 engine = create_engine(
     str(settings.DATABASE_URL),
     echo=False,
-    pool_pre_ping=True
+    pool_pre_ping=True,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    connect_args={
+        "connect_timeout": settings.DB_CONNECT_TIMEOUT,
+        "options": f"-c statement_timeout={settings.DB_STATEMENT_TIMEOUT_MS}",
+    }
+)
+
+# Guards the database reads on the render path
+db_breaker = CircuitBreaker(
+    "postgres",
+    failure_threshold=settings.BREAKER_FAILURE_THRESHOLD,
+    reset_timeout=settings.BREAKER_RESET_TIMEOUT
 )
 
 #sync session maker
@@ -40,33 +58,226 @@ def get_db():
         # This is crucial in a sync 'yield' dependency
         session.close()
 
+# create_all() only creates missing tables, so columns added to existing
+# tables are applied here. Every statement must be idempotent.
+SCHEMA_UPGRADES = [
+    "ALTER TABLE template_versions ADD COLUMN IF NOT EXISTS activate_at TIMESTAMP WITH TIME ZONE",
+    "CREATE INDEX IF NOT EXISTS ix_template_versions_activate_at ON template_versions (activate_at)",
+    "ALTER TABLE template_versions ADD COLUMN IF NOT EXISTS weight INTEGER NOT NULL DEFAULT 100",
+    "ALTER TABLE templates ADD COLUMN IF NOT EXISTS tenant_id VARCHAR NOT NULL DEFAULT 'default'",
+    "CREATE INDEX IF NOT EXISTS ix_templates_tenant_id ON templates (tenant_id)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS uq_templates_tenant_key ON templates (tenant_id, template_key)",
+    # template_key used to be globally unique; keep the index but drop the uniqueness
+    """
+    DO $$ BEGIN
+        IF EXISTS (SELECT 1 FROM pg_indexes
+                   WHERE indexname = 'ix_templates_template_key' AND indexdef LIKE 'CREATE UNIQUE%') THEN
+            DROP INDEX ix_templates_template_key;
+            CREATE INDEX ix_templates_template_key ON templates (template_key);
+        END IF;
+    END $$
+    """,
+    # Content moves to the content-addressed template_contents table
+    "ALTER TABLE template_versions ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64) REFERENCES template_contents (hash)",
+    "CREATE INDEX IF NOT EXISTS ix_template_versions_content_hash ON template_versions (content_hash)",
+    "DROP INDEX IF EXISTS ix_template_versions_content",
+]
+
+
+def guarded_db_call(func):
+    """
+    Runs a database read through db_breaker.
+    Raises BackendUnavailableError if the circuit is open or the call fails
+    at the database level; HTTPExceptions (e.g. 404) count as successes.
+    Any other exception counts as a failure and is re-raised unchanged.
+    """
+    if not db_breaker.allow():
+        raise BackendUnavailableError("postgres circuit is open")
+    try:
+        result = func()
+    except HTTPException:
+        db_breaker.record_success()
+        raise
+    except (SQLAlchemyError, TimeoutError) as e:
+        db_breaker.record_failure()
+        raise BackendUnavailableError(f"postgres call failed: {e}") from e
+    except Exception:
+        # Settles a half-open trial too, so the circuit can't stay stuck
+        db_breaker.record_failure()
+        raise
+    db_breaker.record_success()
+    return result
+
+
 # Initialize and create db and tables
 def init_db() -> None:
     """
     Synchronously creates all tables in the database
-    that are defined by SQLModel.
+    that are defined by SQLModel, then applies SCHEMA_UPGRADES
+    and migrates any inline template content.
     """
     print("Initializing database...")
     SQLModel.metadata.create_all(engine)
+    with engine.begin() as conn:
+        # Index builds on large tables can outlive the request statement timeout
+        conn.execute(text("SET LOCAL statement_timeout = 0"))
+        for statement in SCHEMA_UPGRADES:
+            conn.execute(text(statement))
+    migrate_inline_template_content(engine)
     print("Database tables created (if not exist).")
 
 
 # --- 2. Redis (Sync) Setup ---
 
-try:
-    # This uses the sync 'redis-py' library
-    redis_client = redis.Redis(
+class RedisBackend:
+    """
+    The Redis client behind a circuit breaker.
+    Calls go through call(), which returns a default instead of raising when
+    Redis is unavailable, so callers simply treat it as a cache miss. While
+    the circuit is not closed, probe() (run in the background) pings Redis.
+
+    Idempotent Redis-only calls that must reach Redis (e.g. invalidations) are
+    deferred while it is unavailable and replayed before Redis is used again,
+    so the circuit only closes once they have been applied.
+    Recovery calls registered with on_recovery() may need other backends
+    (e.g. the DB), so they only run from probe(): at the first probe after
+    registration and after every outage, retried until they succeed. Their
+    failures are logged and never counted against Redis.
+    """
+
+    def __init__(self, client, breaker: CircuitBreaker):
+        self.client = client
+        self.breaker = breaker
+        # Deferred calls by key; a deferred call must only use the client it is given
+        self._deferred = OrderedDict()
+        self._recovery_calls = {}
+        self._pending_recovery = set()
+        # Guards the queues only; never held during I/O
+        self._lock = Lock()
+
+    def call(self, func, default=None):
+        """
+        Runs func(client) if the circuit allows it, returning default on refusal
+        or a Redis error. Other exceptions count as failures and are re-raised.
+        """
+        if not self.breaker.allow():
+            return default
+        try:
+            if self._deferred:
+                self._replay_deferred()
+            result = func(self.client)
+        except redis.exceptions.RedisError:
+            self._record_failure()
+            return default
+        except Exception:
+            self._record_failure()
+            raise
+        self.breaker.record_success()
+        return result
+
+    def defer(self, key, func) -> None:
+        """Queues func(client) to run before Redis is next used, replacing any call queued under key."""
+        with self._lock:
+            self._deferred.pop(key, None)
+            self._deferred[key] = func
+
+    def on_recovery(self, key, func) -> None:
+        """Registers func(client) to run on the next probe and whenever Redis comes back after an outage."""
+        with self._lock:
+            self._recovery_calls[key] = func
+            self._pending_recovery.add(key)
+
+    def _record_failure(self) -> None:
+        self.breaker.record_failure()
+        if self.breaker.state != CircuitBreaker.CLOSED:
+            with self._lock:
+                self._pending_recovery.update(self._recovery_calls)
+
+    def _replay_deferred(self) -> None:
+        """Runs the deferred calls in order, raising the first Redis error (the rest stay queued)."""
+        with self._lock:
+            pending = list(self._deferred.items())
+        for key, func in pending:
+            func(self.client)
+            with self._lock:
+                # A newer call may have been queued under the same key meanwhile
+                if self._deferred.get(key) is func:
+                    del self._deferred[key]
+
+    def _run_recovery_calls(self) -> None:
+        with self._lock:
+            pending = [(key, self._recovery_calls[key]) for key in self._pending_recovery]
+        for key, func in pending:
+            try:
+                func(self.client)
+            except redis.exceptions.RedisError:
+                raise
+            except Exception as e:
+                print(f"Redis recovery call '{key}' failed, retrying on the next probe: {e}")
+                continue
+            with self._lock:
+                self._pending_recovery.discard(key)
+
+    def probe(self) -> bool:
+        """
+        Pings Redis unless the circuit is closed, replays deferred calls and only
+        then closes the circuit; pending recovery calls run last.
+        Returns whether Redis is usable.
+        """
+        recovering = self.breaker.state != CircuitBreaker.CLOSED
+        try:
+            if recovering:
+                self.client.ping()
+            self._replay_deferred()
+        except redis.exceptions.RedisError as e:
+            self.breaker.trip()
+            self._record_failure()
+            print(f"Redis still unavailable: {e}")
+            return False
+        if recovering:
+            self.breaker.record_success()
+            print("Reconnected to Redis successfully!")
+        try:
+            self._run_recovery_calls()
+        except redis.exceptions.RedisError as e:
+            self._record_failure()
+            print(f"Redis recovery calls failed: {e}")
+            return False
+        return True
+
+    def status(self) -> dict:
+        return {
+            **self.breaker.snapshot(),
+            "deferred_calls": len(self._deferred),
+            "pending_recovery_calls": len(self._pending_recovery)
+        }
+
+
+# This uses the sync 'redis-py' library; creating the client does not connect
+redis_backend = RedisBackend(
+    redis.Redis(
         host=settings.REDIS_HOST,
         port=settings.REDIS_PORT,
         password=settings.REDIS_PASSWORD,
         db=0,
-        decode_responses=True 
+        # Template content is cached as compressed bytes; text values are decoded by the caller
+        decode_responses=False,
+        socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=settings.REDIS_CONNECT_TIMEOUT
+    ),
+    CircuitBreaker(
+        "redis",
+        failure_threshold=settings.BREAKER_FAILURE_THRESHOLD,
+        reset_timeout=settings.BREAKER_RESET_TIMEOUT
     )
-    redis_client.ping()
+)
+
+try:
+    redis_backend.client.ping()
     print("Connected to Redis successfully!")
 except redis.exceptions.ConnectionError as e:
     print(f"CRITICAL: Could not connect to Redis: {e}")
-    redis_client = None
+    redis_backend.breaker.trip()
 except Exception as e:
     print(f"An unexpected error occurred with Redis: {e}")
-    redis_client = None
\ No newline at end of file
+    redis_backend.breaker.trip()
@@ -1,8 +1,12 @@
 # app/main.py
 from fastapi import FastAPI
 from .routers import templates, keepalive
-from contextlib import asynccontextmanager
-from .database import init_db
+from contextlib import asynccontextmanager, suppress
+from .database import init_db, SessionLocal, redis_backend
+from .scheduler import ActivationScheduler, run_periodically
+from .crud.templates import flush_render_counts, sync_routing_tables
+from .sec import settings
+import asyncio
 from .setup_main import configure_cors
 
 # --- SYNC LIFESPAN ---
@@ -10,12 +14,40 @@ from .setup_main import configure_cors
 async def lifespan(app: FastAPI):
     """
     Asynchronous lifespan function.
-    Runs the synchronous 'init_db()' on startup.
+    Runs the synchronous 'init_db()' on startup and keeps the
+    activation scheduler, variant counter flush and Redis probe running until shutdown.
     """
     print("Application startup... running init_db().")
     init_db()
     print("Database initialized.")
+    # Rebuild routing tables that changed while Redis or this worker was down
+    redis_backend.on_recovery("routing-table-sync", lambda client: sync_routing_tables(SessionLocal, client))
+    scheduler = ActivationScheduler(
+        SessionLocal,
+        poll_interval=settings.ACTIVATION_POLL_INTERVAL,
+        warm_ahead=settings.ACTIVATION_WARM_AHEAD,
+    )
+    background_tasks = [
+        asyncio.create_task(scheduler.run()),
+        asyncio.create_task(run_periodically(
+            flush_render_counts,
+            settings.VARIANT_COUNTER_FLUSH_INTERVAL,
+            "Render counter flush",
+        )),
+        asyncio.create_task(run_periodically(
+            redis_backend.probe,
+            settings.REDIS_PROBE_INTERVAL,
+            "Redis probe",
+        )),
+    ]
     yield
+    for task in background_tasks:
+        task.cancel()
+    for task in background_tasks:
+        with suppress(asyncio.CancelledError):
+            await task
+    # Don't lose the counts accumulated since the last flush
+    flush_render_counts()
 
 # calling an instance of fast api
 app = FastAPI(
@@ -1,13 +1,29 @@
 # app/models.py
 from sqlmodel import SQLModel, Field, Relationship
-from sqlalchemy import Column, DateTime, Text, func, String, Integer, Boolean, text
+from sqlalchemy import Column, DateTime, ForeignKey, LargeBinary, func, String, Integer, BigInteger, Boolean, Index, JSON, text
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Any, Dict
 import uuid
+from ..utils.compression import decompress_content
+
+
+class TemplateContent(SQLModel, table=True):
+    """
+    Template source, stored once per SHA-256 of its text and compressed with zlib.
+    Versions with identical content, in any template, share one row.
+    """
+    __tablename__ = "template_contents"
+
+    hash: str = Field(sa_column=Column(String(64), primary_key=True))
+    data: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
+    size: int = Field(sa_column=Column(Integer, nullable=False))  # uncompressed bytes
+    compressed_size: int = Field(sa_column=Column(Integer, nullable=False))
+    created_at: datetime = Field(sa_column=Column(DateTime(timezone=True), server_default=func.now()))
+
 
 class TemplateVersion(SQLModel, table=True):
     """
-    Stores a specific version of a template, including its content and language.
+    Stores a specific version of a template, its language and a reference to its content.
     """
     __tablename__ = "template_versions"
 
@@ -17,14 +33,25 @@ class TemplateVersion(SQLModel, table=True):
     sa_column=Column(String(36), primary_key=True)
     )
     template_id: str = Field(foreign_key="templates.id")
-    content: str = Field(sa_column=Column(Text, index=True))
+    content_hash: str = Field(sa_column=Column(String(64), ForeignKey("template_contents.hash"), nullable=False, index=True))
     language: str = Field(sa_column=Column(String, index=True))
     version: int = Field(default= 1, sa_column=Column(Integer, index=True))
     is_active: bool = Field(default=False, sa_column=Column(Boolean, server_default=text("false"), index=True))
+    # Share of traffic when several versions of a language are active (A/B testing)
+    weight: int = Field(default=100, sa_column=Column(Integer, server_default=text("100"), nullable=False))
+    # When set, the activation scheduler will activate this version at this time
+    activate_at: Optional[datetime] = Field(default=None, sa_column=Column(DateTime(timezone=True), nullable=True, index=True))
     created_at: datetime = Field(sa_column=Column(DateTime(timezone=True), server_default=func.now()))
     updated_at: datetime = Field(sa_column=Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now()))
-    # Relationship
+    # Relationships
     template: Optional["Template"] = Relationship(back_populates="versions")
+    # Loaded on access only: most queries need just content_hash, not the compressed data
+    blob: Optional[TemplateContent] = Relationship()
+
+    @property
+    def content(self) -> Optional[str]:
+        """The decompressed template source."""
+        return decompress_content(self.blob.data) if self.blob else None
 
 
 class Template(SQLModel, table=True):
@@ -33,13 +60,18 @@ class Template(SQLModel, table=True):
     This table just groups all the versions together.
     """
     __tablename__ = "templates"
+    # template_key is unique per tenant, not globally
+    __table_args__ = (
+        Index("uq_templates_tenant_key", "tenant_id", "template_key", unique=True),
+    )
 
     # Columns
     id: str = Field(
     default_factory=lambda: str(uuid.uuid4()),
     sa_column=Column(String(36), primary_key=True)
     )
-    template_key: str = Field(sa_column=Column(String, unique=True, index=True))
+    tenant_id: str = Field(default="default", sa_column=Column(String, server_default=text("'default'"), nullable=False, index=True))
+    template_key: str = Field(sa_column=Column(String, index=True))
     description: Optional[str] = Field(default=None, sa_column=Column(String))
     created_at: datetime = Field(sa_column=Column(DateTime(timezone=True), server_default=func.now()))
     updated_at: datetime = Field(sa_column=Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now()))
@@ -50,4 +82,27 @@ class Template(SQLModel, table=True):
         sa_relationship_kwargs={
             "cascade": "all, delete-orphan"
         }
-    )
\ No newline at end of file
+    )
+
+
+class TemplateEvent(SQLModel, table=True):
+    """
+    Outbox of template changes, written in the same transaction as the change.
+    revision is assigned in commit order, so consumers can resume from the last
+    revision they applied without missing events.
+    """
+    __tablename__ = "template_events"
+    __table_args__ = (
+        Index("ix_template_events_tenant_revision", "tenant_id", "revision"),
+    )
+
+    revision: Optional[int] = Field(default=None, sa_column=Column(
+        BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True))
+    tenant_id: str = Field(sa_column=Column(String, nullable=False))
+    # template.created, version.created, version.activated, version.deleted or template.deleted
+    event_type: str = Field(sa_column=Column(String, nullable=False))
+    template_key: str = Field(sa_column=Column(String, nullable=False))
+    language: Optional[str] = Field(default=None, sa_column=Column(String, nullable=True))
+    version_id: Optional[str] = Field(default=None, sa_column=Column(String(36), nullable=True))
+    payload: Dict[str, Any] = Field(default_factory=dict, sa_column=Column(JSON, nullable=False))
+    created_at: datetime = Field(sa_column=Column(DateTime(timezone=True), server_default=func.now()))
@@ -1,5 +1,6 @@
-from fastapi import APIRouter, Depends, status
-from ..database import get_db
+from fastapi import APIRouter, Depends, HTTPException, status
+from ..database import get_db, guarded_db_call, db_breaker, redis_backend
+from ..utils.breaker import BackendUnavailableError, CircuitBreaker
 from sqlalchemy import text
 
 
@@ -10,13 +11,21 @@ router = APIRouter()
 def health_check():
     """
     Simple health check endpoint for monitoring.
+    Reports "degraded" while a backend's circuit breaker is not closed; renders
+    are then served from caches and last-known-good copies.
     """
-    return {"status": "ok"}
+    backends = {
+        "postgres": db_breaker.snapshot(),
+        "redis": redis_backend.status(),
+    }
+    degraded = any(b["state"] != CircuitBreaker.CLOSED for b in backends.values())
+    return {"status": "degraded" if degraded else "ok", "backends": backends}
 
 @router.get("/internal/keepalive", status_code=status.HTTP_200_OK, tags=["db keepalive"])
 def keepalive(session=Depends(get_db)):
     """Internal endpoint to keep the DB connection alive."""
-    session.execute(text("SELECT 1"))
+    try:
+        guarded_db_call(lambda: session.execute(text("SELECT 1")))
+    except BackendUnavailableError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
     return {"ok": True}
-
-
@@ -1,26 +1,29 @@
 # app/routers/templates.py
-from fastapi import APIRouter, Depends, HTTPException, status
-from ..database import get_db
-from ..crud.templates import create_template, create_template_version, get_template_by_key, activate_single_template_version, render_template_internal, delete_template_and_version, delete_template_and_all_versions
-from ..schemas.templates import Template, TemplateBase, TemplateVers, TemplateVersionBase, TemplateRead, RenderResponse, RenderRequest
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from ..database import get_db, SessionLocal
+from ..crud.templates import wait_for_template_changes, create_template, create_template_version, get_template_by_key, activate_single_template_version, schedule_template_version_activation, cancel_scheduled_activation, set_template_variants, get_template_variants, get_tenant_usage, get_storage_report, render_template_internal, delete_template_and_version, delete_template_and_all_versions
+from ..schemas.templates import Template, TemplateBase, TemplateVers, TemplateVersionBase, TemplateRead, RenderResponse, RenderRequest, ScheduleActivation, TemplateVariants, TemplateVariantsRead, TenantUsage, StorageReport, TemplateChanges
+from ..sec import settings
+from ..utils.tenants import get_tenant_id
 
+# Every route is scoped to the tenant named in the X-Tenant-ID header ("default" if absent)
 router = APIRouter(
     prefix="/api/v1",
     tags=["templates"]
 )
 
 @router.post("/templates", response_model = Template, status_code = status.HTTP_201_CREATED)
-def create_new_template(template:TemplateBase, db = Depends(get_db)):
+def create_new_template(template:TemplateBase, db = Depends(get_db), tenant_id: str = Depends(get_tenant_id)):
     """
     Creates a new template "group" (e.g., "welcome_email").
     - Args: takes in template_key and optional description.
-        - template_key: str - Unique identifier for the template.
+        - template_key: str - Identifier for the template, unique within the tenant.
         - description: Optional[str] - A brief description of the template. Defaults to None.
     - Returns: the created Template object.
     - Raises: 409 HTTPException if template_key already exists. and 500 for other errors., 422 for pydantic validation errors
     """
     try:
-        return create_template(db, template)
+        return create_template(db, template, tenant_id)
     except HTTPException as http_exc:
         raise http_exc
     except Exception as e:   
@@ -30,7 +33,7 @@ def create_new_template(template:TemplateBase, db = Depends(get_db)):
         )
 
 @router.post("/templates/versions/{template_key}", response_model=TemplateVers, status_code= status.HTTP_201_CREATED)
-def create_new_template_version(template_key: str, version:TemplateVersionBase, db = Depends(get_db)):
+def create_new_template_version(template_key: str, version:TemplateVersionBase, db = Depends(get_db), tenant_id: str = Depends(get_tenant_id)):
     """
     Adds a new version to an existing template.
     -Args:
@@ -44,7 +47,7 @@ def create_new_template_version(template_key: str, version:TemplateVersionBase,
         - 500 for other errors
     """
     try:
-        return create_template_version(db, template_key, version)
+        return create_template_version(db, template_key, version, tenant_id)
     except HTTPException as http_exc:
         raise http_exc
     except Exception as e:
@@ -53,8 +56,38 @@ def create_new_template_version(template_key: str, version:TemplateVersionBase,
             detail=f"Error creating template version: {e}"
         )
 
+# Declared before /templates/{template_key} so "changes" isn't taken for a template_key
+@router.get("/templates/changes", response_model=TemplateChanges, status_code=status.HTTP_200_OK)
+async def get_template_changes(
+    since: int = Query(default=0, ge=0),
+    limit: int = Query(default=100, ge=1, le=1000),
+    timeout: float = Query(default=25, ge=0),
+    include_content: bool = False,
+    tenant_id: str = Depends(get_tenant_id)
+):
+    """
+    Long-polls the tenant's template change feed.
+    - Args:
+        - since: int - Last revision the caller has applied (0 for the full history).
+        - limit: int - Maximum events to return.
+        - timeout: float - Seconds to wait for new events, capped at CHANGE_FEED_MAX_WAIT.
+        - include_content: bool - Also return the content of the versions the events refer to.
+    - Returns: TemplateChanges, oldest event first; pass its revision as since on the next call.
+        Empty if nothing changed before the timeout.
+    - Raises: 503 if the database is unavailable, 500 for other errors.
+    """
+    try:
+        return await wait_for_template_changes(SessionLocal, since, limit, min(timeout, settings.CHANGE_FEED_MAX_WAIT), include_content, tenant_id)
+    except HTTPException as http_exc:
+        raise http_exc
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error reading template changes: {e}"
+        )
+
 @router.get("/templates/{template_key}", response_model=TemplateRead, status_code=status.HTTP_200_OK)
-def get_template(template_key: str, db = Depends(get_db)):
+def get_template(template_key: str, db = Depends(get_db), tenant_id: str = Depends(get_tenant_id)):
     """
     Fetches a template by its unique template_key.
     - Rasises 404 if not found. 500 for other errors.
@@ -62,7 +95,7 @@ def get_template(template_key: str, db = Depends(get_db)):
     - taken template_key as path parameter
     """
     try:
-        return get_template_by_key(db, template_key)
+        return get_template_by_key(db, template_key, tenant_id, with_content=True)
     except HTTPException as http_exc:
         raise http_exc
     except Exception as e:
@@ -72,7 +105,7 @@ def get_template(template_key: str, db = Depends(get_db)):
         )
 
 @router.put("/templates/versions/{template_key}", status_code=status.HTTP_200_OK)
-def activate_template_version(template_key: str, version: str, db = Depends(get_db)):
+def activate_template_version(template_key: str, version: str, db = Depends(get_db), tenant_id: str = Depends(get_tenant_id)):
     """
     Activates a specific version of a template.
     - Deactivates any other active versions for that template.
@@ -80,7 +113,7 @@ def activate_template_version(template_key: str, version: str, db = Depends(get_
     - Returns a success message upon activation.
     """
     try:
-        return activate_single_template_version(template_key, version, db)
+        return activate_single_template_version(template_key, version, db, tenant_id)
     except HTTPException as http_exc:
         raise http_exc
     except Exception as e:
@@ -89,19 +122,93 @@ def activate_template_version(template_key: str, version: str, db = Depends(get_
             detail=f"Error activating template version: {e}"
         )
 
+@router.post("/templates/versions/{template_key}/schedule", status_code=status.HTTP_200_OK)
+def schedule_template_version(template_key: str, schedule: ScheduleActivation, db = Depends(get_db), tenant_id: str = Depends(get_tenant_id)):
+    """
+    Schedules a version to become active at a given time.
+    - The version is pre-warmed into the caches ahead of time and flipped to active at activate_at.
+    - Args:
+        - template_key: str - The unique key of the template.
+        - schedule: ScheduleActivation - The version ID and the activation time (naive times are treated as UTC).
+    - Raises 404 if template or version not found, 400 if activate_at is not in the future. 500 for other errors.
+    """
+    try:
+        return schedule_template_version_activation(template_key, schedule, db, tenant_id)
+    except HTTPException as http_exc:
+        raise http_exc
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error scheduling template version: {e}"
+        )
+
+@router.delete("/templates/versions/{template_key}/schedule", status_code=status.HTTP_204_NO_CONTENT)
+def cancel_template_version_schedule(template_key: str, version: str, db = Depends(get_db), tenant_id: str = Depends(get_tenant_id)):
+    """
+    Cancels a pending scheduled activation.
+    Raises 404 if the template or a scheduled activation for the version is not found.
+    """
+    try:
+        return cancel_scheduled_activation(template_key, version, db, tenant_id)
+    except HTTPException as http_exc:
+        raise http_exc
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error cancelling scheduled activation: {e}"
+        )
+
+@router.put("/templates/variants/{template_key}", status_code=status.HTTP_200_OK)
+def set_template_version_variants(template_key: str, variants: TemplateVariants, db = Depends(get_db), tenant_id: str = Depends(get_tenant_id)):
+    """
+    Activates several versions of one language with traffic weights (A/B testing).
+    - Deactivates any other active version for that language.
+    - Args:
+        - template_key: str - The unique key of the template.
+        - variants: TemplateVariants - The language and a map of version ID to weight.
+    - Raises 404 if template or a version is not found, 400 if a version has another language. 500 for other errors.
+    """
+    try:
+        return set_template_variants(template_key, variants, db, tenant_id)
+    except HTTPException as http_exc:
+        raise http_exc
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error setting template variants: {e}"
+        )
+
+@router.get("/templates/variants/{template_key}", response_model=TemplateVariantsRead, status_code=status.HTTP_200_OK)
+def get_template_version_variants(template_key: str, language: str = "en", db = Depends(get_db), tenant_id: str = Depends(get_tenant_id)):
+    """
+    Lists the active versions of a language with their weights and render counts.
+    - Render counts are flushed from every worker periodically, so they lag slightly.
+    - Raises 404 if template not found. 500 for other errors.
+    """
+    try:
+        return get_template_variants(template_key, language.strip().lower(), db, tenant_id)
+    except HTTPException as http_exc:
+        raise http_exc
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error fetching template variants: {e}"
+        )
+
 @router.post("/render/{template_key}", response_model=RenderResponse, status_code=status.HTTP_200_OK)
-def render_template(template_key: str, request: RenderRequest, db = Depends(get_db)):
+def render_template(template_key: str, request: RenderRequest, db = Depends(get_db), tenant_id: str = Depends(get_tenant_id)):
     """
     **This is the main endpoint your other services will use**
     - It fetches the active template, substitutes variables, and returns the result.
-    - Raises 404 if active template not found. 500 for other errors.
+    - When several versions are active, one is picked by weight; pass recipient_id for a sticky pick.
+    - Raises 404 if active template not found, 429 if the tenant's render rate limit is exceeded. 500 for other errors.
     - Args:
         - template_key: str - The unique key of the template to render.
-        - request: RenderRequest - The request body containing language and variables for substitution.
-    - Returns: RenderResponse containing the rendered content.
+        - request: RenderRequest - The request body containing language, variables for substitution and an optional recipient_id.
+    - Returns: RenderResponse containing the rendered content and the version ID used.
     """
     try:
-        return render_template_internal(template_key, request, db)
+        return render_template_internal(template_key, request, db, tenant_id)
     except HTTPException as http_exc:
         raise http_exc
     except Exception as e:
@@ -111,7 +218,7 @@ def render_template(template_key: str, request: RenderRequest, db = Depends(get_
         )
 
 @router.delete("/templates/versions/{template_key}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_template_version(template_key: str, version: str, db = Depends(get_db)):
+def delete_template_version(template_key: str, version: str, db = Depends(get_db), tenant_id: str = Depends(get_tenant_id)):
     """
     Deletes a specific version of a template.
     Raises 404 if template or version not found.
@@ -120,7 +227,7 @@ def delete_template_version(template_key: str, version: str, db = Depends(get_db
         - NB: **Version here refers to the templateversion ID, not the language or content.**
     """
     try:
-        return delete_template_and_version(template_key, version, db)
+        return delete_template_and_version(template_key, version, db, tenant_id)
     except HTTPException as http_exc:
         raise http_exc
     except Exception as e:
@@ -130,17 +237,48 @@ def delete_template_version(template_key: str, version: str, db = Depends(get_db
         )
     
 @router.delete("/templates/{template_key}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_template(template_key: str, db = Depends(get_db)):
+def delete_template(template_key: str, db = Depends(get_db), tenant_id: str = Depends(get_tenant_id)):
     """
     Deletes a template and all its versions by template_key.
     Raises 404 if template not found.
     """
     try:
-        return delete_template_and_all_versions(template_key, db)
+        return delete_template_and_all_versions(template_key, db, tenant_id)
     except HTTPException as http_exc:
         raise http_exc
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error deleting template: {e}"
+        )
+
+@router.get("/usage", response_model=TenantUsage, status_code=status.HTTP_200_OK)
+def get_usage(db = Depends(get_db), tenant_id: str = Depends(get_tenant_id)):
+    """
+    Returns the tenant's usage for capacity planning.
+    - Stored templates, versions and content bytes.
+    - Renders, rendered bytes and rate-limited requests across all workers (flushed periodically).
+    - The in-process cache usage and quota of the worker that served the request.
+    """
+    try:
+        return get_tenant_usage(db, tenant_id)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error fetching tenant usage: {e}"
+        )
+
+@router.get("/storage", response_model=StorageReport, status_code=status.HTTP_200_OK)
+def get_storage(db = Depends(get_db), tenant_id: str = Depends(get_tenant_id)):
+    """
+    Reports the tenant's template storage savings.
+    - Contents are stored once per hash (deduplicated) and zlib-compressed, in Postgres and Redis.
+    - Includes the decompression cost per cache-miss lookup measured by the worker that served the request.
+    """
+    try:
+        return get_storage_report(db, tenant_id)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error fetching storage report: {e}"
         )
\ No newline at end of file
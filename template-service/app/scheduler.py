@@ -0,0 +1,117 @@
+# app/scheduler.py
+import asyncio
+from datetime import datetime, timedelta, timezone
+from sqlmodel import select
+from .models.templates import Template, TemplateVersion, TemplateContent
+from .crud.templates import swap_active_version, publish_routing_table, warm_content_cache
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class ActivationScheduler:
+    """
+    Activates template versions at their scheduled activate_at.
+
+    Versions due within warm_ahead seconds are loaded once and pre-warmed
+    (compiled in-process, content written to Redis). The flip itself is then
+    a single UPDATE transaction plus a Redis pointer write, with no reads.
+    The clock is injectable so tick() can be driven deterministically.
+    """
+
+    def __init__(self, session_factory, clock=utcnow, poll_interval: int = 5, warm_ahead: int = 300):
+        self._session_factory = session_factory
+        self._clock = clock
+        self.poll_interval = poll_interval
+        self.warm_ahead = warm_ahead
+        self._next_refresh = None
+        # version_id -> pending activation loaded by the last refresh
+        self._pending = {}
+
+    def _refresh(self, db, now: datetime) -> None:
+        """Loads versions due within the warm-ahead window and pre-warms new ones."""
+        statement = select(
+            TemplateVersion.id,
+            TemplateVersion.template_id,
+            TemplateVersion.language,
+            TemplateVersion.version,
+            TemplateVersion.content_hash,
+            TemplateContent.data,
+            TemplateVersion.activate_at,
+            Template.tenant_id,
+            Template.template_key,
+        ).join(Template).join(TemplateContent).where(
+            TemplateVersion.activate_at.is_not(None),
+            TemplateVersion.activate_at <= now + timedelta(seconds=self.warm_ahead),
+        )
+        pending = {}
+        for row in db.execute(statement).all():
+            known = self._pending.get(row.id)
+            if not known or known["activate_at"] != row.activate_at:
+                warm_content_cache(row.content_hash, row.data, row.tenant_id)
+                print(f"Pre-warmed template '{row.template_key}' version '{row.id}' for activation at {row.activate_at.isoformat()}")
+            pending[row.id] = row._asdict()
+        # Anything no longer returned was cancelled, rescheduled or activated elsewhere
+        self._pending = pending
+
+    def _activate(self, db, pending: dict) -> None:
+        swapped = swap_active_version(
+            db,
+            pending["template_key"],
+            pending["template_id"],
+            pending["language"],
+            pending,
+            scheduled_at=pending["activate_at"],
+            tenant_id=pending["tenant_id"],
+        )
+        if swapped:
+            publish_routing_table(pending["template_key"], pending["language"], [
+                {"id": pending["id"], "version": pending["version"], "weight": 100,
+                 "content_hash": pending["content_hash"], "data": pending["data"]}
+            ], pending["tenant_id"])
+            print(f"Activated template '{pending['template_key']}' version '{pending['id']}' on schedule")
+
+    def tick(self) -> None:
+        """Runs one scheduling pass: refresh if due, then flip every version whose time has come."""
+        now = self._clock()
+        with self._session_factory() as db:
+            if self._next_refresh is None or now >= self._next_refresh:
+                self._refresh(db, now)
+                self._next_refresh = now + timedelta(seconds=self.poll_interval)
+            for version_id, pending in list(self._pending.items()):
+                if pending["activate_at"] <= now:
+                    self._activate(db, pending)
+                    del self._pending[version_id]
+
+    def seconds_until_next_tick(self) -> float:
+        """Sleeps until the next refresh or the next pending activation, whichever is sooner."""
+        now = self._clock()
+        wake_times = [p["activate_at"] for p in self._pending.values()]
+        if self._next_refresh is not None:
+            wake_times.append(self._next_refresh)
+        if not wake_times:
+            return self.poll_interval
+        delay = (min(wake_times) - now).total_seconds()
+        return max(0.0, min(delay, self.poll_interval))
+
+    async def run(self) -> None:
+        """Background loop for the service lifespan; blocking DB work runs in a thread."""
+        while True:
+            try:
+                await asyncio.to_thread(self.tick)
+                delay = self.seconds_until_next_tick()
+            except Exception as e:
+                print(f"Activation scheduler error: {e}")
+                delay = self.poll_interval
+            await asyncio.sleep(delay)
+
+
+async def run_periodically(func, interval: int, name: str) -> None:
+    """Calls a blocking function in a thread every interval seconds until cancelled."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(func)
+        except Exception as e:
+            print(f"{name} error: {e}")
@@ -1,7 +1,7 @@
 # app/schemas.py
 from pydantic import BaseModel, Field, field_validator
-from typing import Optional, Dict, Any
-from datetime import datetime
+from typing import Optional, Dict, Any, List
+from datetime import datetime, timezone
 from fastapi import HTTPException, status
 
 #make inputation case insensitive
@@ -47,8 +47,11 @@ class TemplateVersionBase(BaseModel):
 
 class TemplateVers(TemplateVersionBase):
     id: str #placehoder to come back
+    content_hash: Optional[str] = None # None only for legacy versions stored without content
     version: int
     is_active: bool
+    weight: int
+    activate_at: Optional[datetime] = None
     created_at: datetime
     updated_at: datetime
     template_id: str
@@ -56,6 +59,65 @@ class TemplateVers(TemplateVersionBase):
     class Config:
         from_attributes = True # Replaced orm_mode
 
+class ScheduleActivation(BaseModel):
+    version: str
+    activate_at: datetime
+
+    @field_validator('activate_at')
+    @classmethod
+    def validate_activate_at(cls, v: datetime) -> datetime:
+        """
+        Validates the activation time:
+        1. Treats a naive datetime as UTC.
+        2. Normalizes it to UTC.
+        """
+        if v.tzinfo is None:
+            return v.replace(tzinfo=timezone.utc)
+        return v.astimezone(timezone.utc)
+
+class TemplateVariants(BaseModel):
+    language: str
+    weights: Dict[str, int]
+
+    @field_validator('language')
+    @classmethod
+    def validate_language(cls, v: str) -> str:
+        """Strips whitespace, lowercases and rejects an empty language code."""
+        v_stripped = v.strip().lower()
+        if not v_stripped:
+            raise ValueError("language cannot be empty or just whitespace")
+        return v_stripped
+
+    @field_validator('weights')
+    @classmethod
+    def validate_weights(cls, v: Dict[str, int]) -> Dict[str, int]:
+        """
+        Validates the weights (version ID -> weight):
+        1. At least one version.
+        2. No negative weights.
+        3. At least one weight above zero.
+        """
+        if not v:
+            raise ValueError("weights must name at least one version")
+        if any(weight < 0 for weight in v.values()):
+            raise ValueError("weights cannot be negative")
+        if sum(v.values()) == 0:
+            raise ValueError("at least one weight must be greater than zero")
+        return v
+
+
+class VariantRead(BaseModel):
+    id: str
+    version: int
+    weight: int
+    renders: int
+
+
+class TemplateVariantsRead(BaseModel):
+    template_key: str
+    language: str
+    variants: list[VariantRead] = []
+
 # --- Template Schemas ---
 class TemplateBase(BaseModel):
     template_key: str
@@ -100,6 +162,7 @@ class TemplateBase(BaseModel):
 
 class Template(TemplateBase):
     id: str
+    tenant_id: str
     template_key: str
     description: Optional[str] = None
     created_at: datetime
@@ -112,6 +175,7 @@ class Template(TemplateBase):
 
 class TemplateRead(TemplateBase):
     id: str
+    tenant_id: str
     template_key: str
     description: Optional[str] = None
     created_at: datetime
@@ -121,10 +185,76 @@ class TemplateRead(TemplateBase):
     class Config:
         from_attributes = True      
 
+# --- Tenant Schemas ---
+class TenantCacheUsage(BaseModel):
+    entries: int
+    bytes: int
+    quota_bytes: int
+    hits: int
+    misses: int
+    evictions: int
+    oversized: int
+
+
+class TenantUsage(BaseModel):
+    tenant_id: str
+    templates: int
+    versions: int
+    content_bytes: int
+    renders: int
+    rendered_bytes: int
+    rate_limited: int
+    degraded_renders: int
+    render_rate_limit: float
+    worker_cache: TenantCacheUsage
+
+class DecompressionStats(BaseModel):
+    count: int
+    total_ms: float
+    avg_us: float
+    max_us: float
+
+
+class StorageReport(BaseModel):
+    tenant_id: str
+    versions: int
+    unique_contents: int
+    logical_bytes: int
+    unique_bytes: int
+    stored_bytes: int
+    saved_bytes: int
+    dedup_ratio: float
+    compression_ratio: float
+    decompression: DecompressionStats
+
+# --- Change Feed Schemas ---
+class TemplateEventRead(BaseModel):
+    revision: int
+    event_type: str
+    template_key: str
+    language: Optional[str] = None
+    version_id: Optional[str] = None
+    payload: Dict[str, Any]
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class TemplateChanges(BaseModel):
+    # Pass as ?since= on the next call to resume after these events
+    revision: int
+    events: List[TemplateEventRead]
+    # Decompressed content by hash for the versions in these events (include_content=true)
+    contents: Dict[str, str] = {}
+
 # --- Rendering Schemas ---
 class RenderRequest(BaseModel):
     language: str = "en"
     variables: Dict[str, Any]
+    # Sticky A/B assignment: the same recipient always gets the same variant
+    recipient_id: Optional[str] = None
 
 class RenderResponse(BaseModel):
-    rendered_content: str
\ No newline at end of file
+    rendered_content: str
+    version_id: Optional[str] = None
\ No newline at end of file
@@ -3,7 +3,7 @@ from decouple import config
 from pydantic_settings import BaseSettings
 from .utils.database import normalize_url
 from pydantic import PostgresDsn, field_validator
-from typing import Optional
+from typing import Optional, Dict
 
 # normalized_db = normalize_url(config('DATABASE_URL'))
 class Settings(BaseSettings):
@@ -13,6 +13,38 @@ class Settings(BaseSettings):
     REDIS_HOST: str
     REDIS_PORT: int
     REDIS_PASSWORD: Optional[str] = None
+    # Backend timeouts (seconds unless noted), so a slow backend fails fast
+    REDIS_SOCKET_TIMEOUT: float = 0.5
+    REDIS_CONNECT_TIMEOUT: float = 1.0
+    DB_CONNECT_TIMEOUT: int = 3
+    DB_STATEMENT_TIMEOUT_MS: int = 2000
+    DB_POOL_TIMEOUT: float = 5
+    # Circuit breakers: consecutive failures before opening, and seconds before a trial call
+    BREAKER_FAILURE_THRESHOLD: int = 5
+    BREAKER_RESET_TIMEOUT: float = 10
+    # Seconds between background Redis probes while its circuit is open
+    REDIS_PROBE_INTERVAL: int = 5
+    # Scheduled activation: how often to poll for due versions and how far
+    # ahead (in seconds) to pre-warm a scheduled version's cache entries.
+    ACTIVATION_POLL_INTERVAL: int = 5
+    ACTIVATION_WARM_AHEAD: int = 300
+    # Per-tenant byte quota of each worker's in-process template cache,
+    # with optional overrides as a JSON object, e.g. {"brand_a": 16777216}
+    TENANT_CACHE_QUOTA_BYTES: int = 8 * 1024 * 1024
+    TENANT_CACHE_QUOTAS: Dict[str, int] = {}
+    # Per-tenant render requests per second, per worker (0 = unlimited),
+    # with optional overrides as a JSON object, e.g. {"brand_a": 200}
+    TENANT_RENDER_RATE_LIMIT: float = 0
+    TENANT_RENDER_RATE_LIMITS: Dict[str, float] = {}
+    # Seconds between flushes of per-worker variant render counts to Redis
+    VARIANT_COUNTER_FLUSH_INTERVAL: int = 10
+    # Change feed: seconds between checks while a long-poll waits, the longest
+    # wait a client may ask for, and the approximate length of each tenant's Redis Stream
+    CHANGE_FEED_POLL_INTERVAL: float = 0.5
+    CHANGE_FEED_MAX_WAIT: int = 30
+    CHANGE_STREAM_MAXLEN: int = 10000
+    # Longest a change feed writer waits for its tenant's outbox lock (milliseconds)
+    CHANGE_FEED_LOCK_TIMEOUT_MS: int = 10000
 
     # 2. Add the normalizer as a validator
     @field_validator("DATABASE_URL", mode="before")
@@ -0,0 +1,87 @@
+# app/utils/breaker.py
+import time
+from threading import Lock
+
+
+class BackendUnavailableError(Exception):
+    """Raised when a backend call is refused by its open circuit or fails."""
+
+
+class CircuitBreaker:
+    """
+    Stops calling a backend after repeated failures.
+
+    - closed: calls go through; failure_threshold consecutive failures open it.
+    - open: calls are refused until reset_timeout seconds have passed.
+    - half_open: a single trial call is let through; success closes the
+      circuit, failure opens it again.
+    The clock is injectable so state changes can be driven deterministically.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 10.0, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = Lock()
+
+    def _current_state(self) -> str:
+        if self._state == self.OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._trial_in_flight = False
+        return self._state
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def allow(self) -> bool:
+        """Whether a call may be attempted now."""
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._current_state() == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._open()
+
+    def trip(self) -> None:
+        """Opens the circuit immediately, e.g. when a health probe fails."""
+        with self._lock:
+            self._open()
+
+    def _open(self) -> None:
+        self._state = self.OPEN
+        self._opened_at = self._clock()
+        self._trial_in_flight = False
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            state = self._current_state()
+            return {
+                "state": state,
+                "consecutive_failures": self._failures,
+                "open_for_seconds": (self._clock() - self._opened_at) if state != self.CLOSED else 0.0,
+            }
@@ -0,0 +1,84 @@
+# app/utils/cache.py
+from collections import Counter, OrderedDict
+from threading import Lock
+from .templates import compile_template
+
+
+class CompiledTemplateCache:
+    """
+    Process-local cache of compiled Jinja templates, keyed by content hash and
+    partitioned by tenant. A hash always names the same content, so entries never
+    go stale and are only ever evicted to stay within quota.
+
+    Every tenant has its own LRU with a byte quota (measured on the template
+    source), so one tenant's large templates can only evict that tenant's entries.
+    """
+
+    def __init__(self, default_quota: int, quotas: dict | None = None):
+        self.default_quota = default_quota
+        self.quotas = quotas or {}
+        self._entries = {}  # tenant_id -> OrderedDict[content_hash, (compiled, size)]
+        self._usage = Counter()  # tenant_id -> bytes cached
+        self._stats = {}  # tenant_id -> Counter of hits, misses, evictions, oversized
+        self._lock = Lock()
+
+    def quota_for(self, tenant_id: str) -> int:
+        return self.quotas.get(tenant_id, self.default_quota)
+
+    def _tenant_stats(self, tenant_id: str) -> Counter:
+        stats = self._stats.get(tenant_id)
+        if stats is None:
+            stats = self._stats[tenant_id] = Counter()
+        return stats
+
+    def get(self, tenant_id: str, content_hash: str):
+        """Returns the compiled template for a content hash, or None on a miss."""
+        with self._lock:
+            entries = self._entries.get(tenant_id)
+            entry = entries.get(content_hash) if entries else None
+            if entry is None:
+                self._tenant_stats(tenant_id)["misses"] += 1
+                return None
+            entries.move_to_end(content_hash)
+            self._tenant_stats(tenant_id)["hits"] += 1
+            return entry[0]
+
+    def put(self, tenant_id: str, content_hash: str, content: str):
+        """
+        Compiles the content (outside the lock) and stores it under its hash,
+        evicting the tenant's least recently used entries to stay within quota.
+        A template larger than the whole quota is returned but not cached.
+        """
+        compiled = compile_template(content)
+        size = len(content.encode())
+        quota = self.quota_for(tenant_id)
+        with self._lock:
+            stats = self._tenant_stats(tenant_id)
+            if size > quota:
+                stats["oversized"] += 1
+                return compiled
+            entries = self._entries.setdefault(tenant_id, OrderedDict())
+            previous = entries.pop(content_hash, None)
+            if previous is not None:
+                self._usage[tenant_id] -= previous[1]
+            entries[content_hash] = (compiled, size)
+            self._usage[tenant_id] += size
+            while self._usage[tenant_id] > quota:
+                _, (_, evicted_size) = entries.popitem(last=False)
+                self._usage[tenant_id] -= evicted_size
+                stats["evictions"] += 1
+        return compiled
+
+    def stats(self, tenant_id: str) -> dict:
+        """Cache usage of one tenant in this worker."""
+        with self._lock:
+            stats = self._stats.get(tenant_id, Counter())
+            return {
+                "entries": len(self._entries.get(tenant_id, ())),
+                "bytes": self._usage[tenant_id],
+                "quota_bytes": self.quota_for(tenant_id),
+                "hits": stats["hits"],
+                "misses": stats["misses"],
+                "evictions": stats["evictions"],
+                "oversized": stats["oversized"],
+            }
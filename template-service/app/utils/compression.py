@@ -0,0 +1,27 @@
+# app/utils/compression.py
+import hashlib
+import time
+import zlib
+from .metrics import TimingStats
+
+# Written once per unique content, read on every cache miss: favour ratio over speed
+COMPRESSION_LEVEL = 9
+
+# Per-worker cost of turning stored bytes back into template source
+decompression_timings = TimingStats()
+
+
+def content_hash(content: str) -> str:
+    """SHA-256 hex digest of the template source, used as its storage key."""
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def compress_content(content: str) -> bytes:
+    return zlib.compress(content.encode(), COMPRESSION_LEVEL)
+
+
+def decompress_content(data: bytes) -> str:
+    start = time.perf_counter()
+    content = zlib.decompress(data).decode()
+    decompression_timings.observe(time.perf_counter() - start)
+    return content
@@ -8,4 +8,84 @@ def normalize_url(url: str):
     if "sslmode" in url:
         url = url.split("?")[0]
 
-    return url
\ No newline at end of file
+    return url
+
+def migrate_inline_template_content(engine, batch_size: int = 500) -> None:
+    """
+    Moves template_versions.content (one full copy per version) into the
+    content-addressed, compressed template_contents table.
+    Idempotent: only versions without a content_hash are migrated, in batches
+    of one transaction each, and the inline copy is cleared as it is moved.
+    content_hash is made NOT NULL once, when no version is left without it.
+    """
+    from sqlalchemy import text
+    from sqlalchemy.exc import OperationalError
+    from .compression import content_hash, compress_content
+
+    with engine.connect() as conn:
+        has_inline_content = conn.execute(text(
+            "SELECT 1 FROM information_schema.columns "
+            "WHERE table_name = 'template_versions' AND column_name = 'content'"
+        )).first()
+    if not has_inline_content:
+        return
+
+    migrated = inline_bytes = 0
+    while True:
+        with engine.begin() as conn:
+            conn.execute(text("SET LOCAL statement_timeout = 0"))
+            rows = conn.execute(text(
+                "SELECT id, content FROM template_versions "
+                "WHERE content_hash IS NULL AND content IS NOT NULL LIMIT :limit"
+            ), {"limit": batch_size}).all()
+            if not rows:
+                break
+            contents = {}
+            versions = []
+            for row in rows:
+                digest = content_hash(row.content)
+                if digest not in contents:
+                    data = compress_content(row.content)
+                    contents[digest] = {"hash": digest, "data": data, "size": len(row.content.encode()), "compressed_size": len(data)}
+                versions.append({"id": row.id, "hash": digest})
+                inline_bytes += len(row.content.encode())
+            conn.execute(text(
+                "INSERT INTO template_contents (hash, data, size, compressed_size) "
+                "VALUES (:hash, :data, :size, :compressed_size) ON CONFLICT (hash) DO NOTHING"
+            ), list(contents.values()))
+            conn.execute(text(
+                "UPDATE template_versions SET content_hash = :hash, content = NULL WHERE id = :id"
+            ), versions)
+            migrated += len(versions)
+
+    if migrated:
+        with engine.connect() as conn:
+            stored_bytes = conn.execute(text("SELECT COALESCE(SUM(compressed_size), 0) FROM template_contents")).scalar()
+        print(f"Migrated {migrated} template versions to content storage: "
+              f"{inline_bytes} inline bytes, {stored_bytes} bytes now stored in template_contents.")
+
+    with engine.connect() as conn:
+        is_nullable = conn.execute(text(
+            "SELECT is_nullable FROM information_schema.columns "
+            "WHERE table_name = 'template_versions' AND column_name = 'content_hash'"
+        )).scalar()
+        if is_nullable != "YES":
+            return
+        # Legacy versions stored without any content have nothing to move; they are
+        # reported instead of guessed at, and content_hash stays nullable until they
+        # are deleted or re-created.
+        missing = conn.execute(text(
+            "SELECT id FROM template_versions WHERE content_hash IS NULL"
+        )).scalars().all()
+    if missing:
+        print(f"{len(missing)} template versions have no content and could not be migrated; "
+              f"content_hash stays nullable until they are removed: {', '.join(missing[:20])}")
+        return
+
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("SET LOCAL lock_timeout = '5s'"))
+            conn.execute(text("ALTER TABLE template_versions ALTER COLUMN content_hash SET NOT NULL"))
+    except OperationalError as e:
+        # Another worker holds the table; whichever one starts next retries.
+        print(f"Could not set template_versions.content_hash NOT NULL, retrying on next startup: {e}")
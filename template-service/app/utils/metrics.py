@@ -0,0 +1,54 @@
+# app/utils/metrics.py
+from collections import Counter
+from threading import Lock
+
+
+class RenderCounters:
+    """
+    Per-worker render counts, keyed by any hashable label (e.g. a variant).
+    Incrementing is an in-memory operation; drain() hands the accumulated
+    deltas to a periodic flusher and resets them.
+    """
+
+    def __init__(self):
+        self._counts = Counter()
+        self._lock = Lock()
+
+    def increment(self, key, amount: int = 1) -> None:
+        with self._lock:
+            self._counts[key] += amount
+
+    def drain(self) -> dict:
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+        return dict(counts)
+
+    def restore(self, counts: dict) -> None:
+        """Adds back deltas that could not be flushed."""
+        with self._lock:
+            self._counts.update(counts)
+
+
+class TimingStats:
+    """Count, total and maximum of observed durations (in seconds), per worker."""
+
+    def __init__(self):
+        self._count = 0
+        self._total = 0.0
+        self._max = 0.0
+        self._lock = Lock()
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self._count += 1
+            self._total += seconds
+            self._max = max(self._max, seconds)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "count": self._count,
+                "total_ms": self._total * 1000,
+                "avg_us": (self._total / self._count * 1_000_000) if self._count else 0.0,
+                "max_us": self._max * 1_000_000,
+            }
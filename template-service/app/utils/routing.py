@@ -0,0 +1,43 @@
+# app/utils/routing.py
+import hashlib
+import json
+import random
+from bisect import bisect_right
+
+
+class RoutingTable:
+    """
+    Weighted traffic split across the active versions of one template/language.
+    Built once from the cached table and reused, so picking a variant is a
+    hash plus a bisect with no I/O.
+    """
+
+    def __init__(self, variants: list[dict], raw: str | None = None):
+        # variants: [{"id": ..., "version": ..., "weight": ..., "content_hash": ...}] ordered by version
+        self.raw = raw if raw is not None else json.dumps(variants)
+        self.variants = variants
+        self.cumulative = []
+        total = 0
+        for v in variants:
+            total += max(v["weight"], 0)
+            self.cumulative.append(total)
+        self.total = total
+
+    @classmethod
+    def from_json(cls, raw: str) -> "RoutingTable":
+        return cls(json.loads(raw), raw=raw)
+
+    def assign(self, salt: str, recipient_id: str | None = None) -> dict:
+        """
+        Picks a variant.
+        The same recipient_id always lands on the same variant while the weights
+        are unchanged; without one, the pick is random by weight.
+        """
+        if len(self.variants) == 1 or self.total == 0:
+            return self.variants[0]
+        if recipient_id is None:
+            point = random.randrange(self.total)
+        else:
+            digest = hashlib.blake2b(f"{salt}:{recipient_id}".encode(), digest_size=8).digest()
+            point = int.from_bytes(digest, "big") % self.total
+        return self.variants[bisect_right(self.cumulative, point)]
@@ -5,14 +5,20 @@ from fastapi import HTTPException, status
 # Setup Jinja2 environment to render strings
 jinja_env = Environment(loader=BaseLoader())
 
-def render_template_string(content: str, variables: dict) -> str:
-    """Uses Jinja2 to substitute variables in a template string."""
+def compile_template(content: str):
+    """Compiles a template string into a reusable Jinja2 Template."""
+    try:
+        return jinja_env.from_string(content)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail={"message": f"Error compiling template: {e}"})
+
+def render_compiled_template(template, variables: dict) -> str:
+    """Renders an already compiled Jinja2 Template with the given variables."""
     try:
-        template = jinja_env.from_string(content)
         return template.render(variables)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail={"message": f"Error rendering template: {e}"})
-
-
@@ -0,0 +1,57 @@
+# app/utils/tenants.py
+import re
+import time
+from threading import Lock
+from fastapi import Header, HTTPException, status
+
+DEFAULT_TENANT = "default"
+# Tenant ids end up in cache keys, so keep them to a safe alphabet (no ':')
+TENANT_ID_PATTERN = re.compile(r"^[a-z0-9_-]{1,64}$")
+
+
+def get_tenant_id(x_tenant_id: str = Header(default=DEFAULT_TENANT)) -> str:
+    """
+    Tenant dependency for FastAPI.
+    Reads the X-Tenant-ID header; requests without it belong to the default tenant.
+    """
+    tenant_id = x_tenant_id.strip().lower()
+    if not TENANT_ID_PATTERN.match(tenant_id):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="X-Tenant-ID must be 1-64 characters of a-z, 0-9, '_' or '-'")
+    return tenant_id
+
+
+class TenantRateLimiter:
+    """
+    Per-tenant token buckets, one set per worker.
+    A rate of 0 (or less) means the tenant is not limited. The bucket holds
+    one second of tokens, so a tenant can burst up to its per-second rate.
+    """
+
+    def __init__(self, default_rate: float, rates: dict | None = None, clock=time.monotonic):
+        self.default_rate = default_rate
+        self.rates = rates or {}
+        self._clock = clock
+        self._buckets = {}  # tenant_id -> [tokens, last refill time]
+        self._lock = Lock()
+
+    def rate_for(self, tenant_id: str) -> float:
+        return self.rates.get(tenant_id, self.default_rate)
+
+    def allow(self, tenant_id: str) -> bool:
+        rate = self.rate_for(tenant_id)
+        if rate <= 0:
+            return True
+        capacity = max(rate, 1.0)
+        now = self._clock()
+        with self._lock:
+            bucket = self._buckets.get(tenant_id)
+            if bucket is None:
+                bucket = self._buckets[tenant_id] = [capacity, now]
+            bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                return False
+            bucket[0] -= 1
+            return True